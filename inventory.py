@@ -20,197 +20,724 @@ except Exception:
         pass
 
 import argparse
+import functools
+import hashlib
 import subprocess
-import json
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as pa_feather
+import pyarrow.json as pa_json
+import pyarrow.parquet as pq
+import xlsxwriter
 from datetime import datetime
 import os
-from google.protobuf.json_format import MessageToDict
+import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from google.protobuf.json_format import MessageToDict, MessageToJson
+
+# Keep string columns in Arrow buffers and avoid defensive copies while the
+# DataFrames are built; both are always on from pandas 3.0.
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+    pd.set_option('future.infer_string', True)
 
 
 def run_cmd(cmd):
+    """Run a shell command and return its stdout as bytes, or None if it failed."""
     try:
-        result = subprocess.run(cmd, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        return result.stdout
+        # Send stdout to a temporary file rather than a pipe so large JSON
+        # listings are written by the OS and read back in one call.
+        with tempfile.TemporaryFile() as out:
+            subprocess.run(cmd, shell=True, check=True, stdout=out, stderr=subprocess.PIPE)
+            out.seek(0)
+            return out.read()
     except subprocess.CalledProcessError as e:
         # Don't treat API-specific errors as fatal here; return None so callers can decide
         # and avoid noisy stack traces.
-        err = e.stderr or ''
+        err = (e.stderr or b'').decode(errors='replace')
         print(f"Command failed: {cmd}\n{err}", file=sys.stderr)
         return None
 
 
-def is_service_enabled(project, service_name):
-    """Return True if the given service (e.g. container.googleapis.com) is enabled for project."""
+_CLIENTS = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_client(name, factory):
+    """Return the shared client registered under name, creating it on first use.
+
+    Clients are kept for the whole run so credentials are loaded and the
+    HTTP/gRPC channel is set up once rather than per project or per call.
+    """
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(name)
+        if client is None:
+            try:
+                client = factory()
+            except Exception as e:
+                # remember the failure (typically missing credentials) so it
+                # is not retried for every project and call
+                client = e
+            _CLIENTS[name] = client
+    if isinstance(client, Exception):
+        raise client
+    return client
+
+
+def is_missing_credentials(error):
+    """Return True if error means Application Default Credentials are not set up."""
+    try:
+        from google.auth.exceptions import DefaultCredentialsError
+    except Exception:
+        return False
+    return isinstance(error, DefaultCredentialsError)
+
+
+@functools.lru_cache(maxsize=None)
+def _list_enabled_services(project):
+    """Return the names of the services enabled for project, fetched once per project."""
     out = run_cmd(f"gcloud services list --project={project} --enabled --format=json")
     if not out:
-        return False
+        return frozenset()
     try:
-        services = json.loads(out)
-        for s in services:
-            # gcloud may return objects with different shapes; try common fields
-            if s.get('name') == service_name or s.get('serviceName') == service_name:
-                return True
-            cfg = s.get('config') or {}
-            if isinstance(cfg, dict) and cfg.get('name') == service_name:
-                return True
-        return False
+        services = orjson.loads(out)
     except Exception:
-        # fallback to simple substring check
-        return service_name in out
+        # fallback to picking service names out of the raw output
+        return frozenset(m.decode() for m in re.findall(rb'[\w.-]+\.googleapis\.com', out))
+    names = set()
+    for s in services:
+        # gcloud may return objects with different shapes; collect the common fields
+        names.add(s.get('name'))
+        names.add(s.get('serviceName'))
+        cfg = s.get('config') or {}
+        if isinstance(cfg, dict):
+            names.add(cfg.get('name'))
+    names.discard(None)
+    return frozenset(names)
 
 
-def gather_asset_resources(project):
+def is_service_enabled(project, service_name):
+    """Return True if the given service (e.g. container.googleapis.com) is enabled for project."""
+    return service_name in _list_enabled_services(project)
+
+
+# search_all_resources caps page_size at 500; asking for the maximum keeps
+# the number of round trips for large projects low.
+ASSET_PAGE_SIZE = 500
+
+
+def gather_asset_resources(project, asset_types=None):
     """Use the Python Cloud Asset client to search all resources in a project.
 
+    asset_types optionally restricts the search to the given asset types
+    (e.g. ``compute.googleapis.com/Instance``).
     Falls back to gcloud if the client library is not available.
-    Returns a list of dicts.
+    Returns an Arrow table, or a list of dicts when the gcloud fallback is
+    used or the resources cannot be read as one table.
     """
     try:
         from google.cloud import asset_v1
     except Exception:
         # fallback to gcloud CLI
-        cmd = f"gcloud asset search-all-resources --scope=projects/{project} --project={project} --format=json"
+        cmd = (f"gcloud asset search-all-resources --scope=projects/{project} --project={project} "
+               f"--page-size={ASSET_PAGE_SIZE} --format=json")
+        if asset_types:
+            cmd += f" --asset-types={','.join(asset_types)}"
         out = run_cmd(cmd)
         if out:
             try:
-                return json.loads(out)
+                return orjson.loads(out)
             except Exception:
                 return []
         return []
 
-    client = asset_v1.AssetServiceClient()
-    scope = f"projects/{project}"
-    resources = []
+    client = get_client('asset', asset_v1.AssetServiceClient)
+    request = {
+        'scope': f"projects/{project}",
+        'asset_types': asset_types or [],
+        'page_size': ASSET_PAGE_SIZE,
+    }
+    # Write one JSON line per resource to a temporary file and parse the file
+    # in Arrow at the end, so only the compact columnar result is held in
+    # memory rather than a nested Python object per resource.
+    tmp = tempfile.NamedTemporaryFile('wb', suffix='.ndjson', delete=False)
     try:
-        # iterate with paging handled by the client
-        for r in client.search_all_resources(scope=scope):
+        with tmp:
             try:
-                d = MessageToDict(r._pb, preserving_proto_field_name=True)
-            except Exception:
-                # best effort conversion
-                d = {}
-                for field in r.DESCRIPTOR.fields:
-                    val = getattr(r, field.name, None)
-                    if val is not None:
-                        d[field.name] = str(val)
-            resources.append(d)
+                # iterate with paging handled by the client
+                for r in client.search_all_resources(request=request):
+                    try:
+                        line = MessageToJson(r._pb, preserving_proto_field_name=True, indent=None).encode()
+                    except Exception:
+                        # best effort conversion
+                        d = {}
+                        for field in r.DESCRIPTOR.fields:
+                            val = getattr(r, field.name, None)
+                            if val is not None:
+                                d[field.name] = str(val)
+                        line = orjson.dumps(d)
+                    tmp.write(line)
+                    tmp.write(b"\n")
+            except Exception as e:
+                print(f"Cloud Asset client error: {e}", file=sys.stderr)
+        return read_ndjson(tmp.name)
+    finally:
+        os.remove(tmp.name)
+
+
+# Timestamp fields of asset search results. They are always read as text:
+# Arrow would otherwise infer timestamp[s] for whole-second values but keep
+# values with fractional seconds as strings, so the column type would vary
+# between blocks and projects.
+ASSET_TIME_FIELDS = ('create_time', 'update_time')
+
+
+def _timestamps_as_strings(type_):
+    """Return type_ with every timestamp type (including nested ones) replaced by string."""
+    if pa.types.is_timestamp(type_):
+        return pa.string()
+    if pa.types.is_struct(type_):
+        return pa.struct([field.with_type(_timestamps_as_strings(field.type)) for field in type_])
+    if pa.types.is_list(type_):
+        return pa.list_(type_.value_field.with_type(_timestamps_as_strings(type_.value_type)))
+    return type_
+
+
+def read_ndjson(path):
+    """Parse a newline-delimited JSON file into an Arrow table.
+
+    Date-like strings are kept as the original text rather than converted
+    to timestamps. Falls back to a list of dicts when the records do not
+    share a schema Arrow can infer (e.g. a field that is a string in one
+    record and an object in another).
+    """
+    if os.path.getsize(path) == 0:
+        return []
+    try:
+        time_fields = pa.schema([(name, pa.string()) for name in ASSET_TIME_FIELDS])
+        table = pa_json.read_json(path, parse_options=pa_json.ParseOptions(explicit_schema=time_fields))
+        schema = pa.schema([field.with_type(_timestamps_as_strings(field.type)) for field in table.schema])
+        if schema != table.schema:
+            # Other fields were inferred as timestamps; read again with them
+            # declared as strings so their text is kept exactly.
+            table = pa_json.read_json(path, parse_options=pa_json.ParseOptions(explicit_schema=schema))
+        # declared time fields that no record had come back as all-null columns
+        missing = [name for name in ASSET_TIME_FIELDS if table.column(name).null_count == table.num_rows]
+        return table.drop_columns(missing)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        with open(path, 'rb') as f:
+            return [orjson.loads(line) for line in f if line.strip()]
+
+
+def export_asset_resources(project, bucket, object_name, asset_types=None):
+    """Export all resources of a project straight to GCS with Cloud Asset export.
+
+    The export runs server side and writes newline-delimited JSON to
+    gs://bucket/object_name, so nothing is loaded into local memory or disk.
+    Returns ``(uri, finished)``: uri is None if the export failed, and
+    finished is False when the export was only started (gcloud fallback).
+    """
+    uri = f"gs://{bucket}/{object_name}"
+    try:
+        from google.cloud import asset_v1
+    except Exception:
+        # fallback to gcloud CLI; this starts the export and returns without
+        # waiting for the operation to finish
+        cmd = f"gcloud asset export --project={project} --content-type=resource --output-path={uri}"
+        if asset_types:
+            cmd += f" --asset-types={','.join(asset_types)}"
+        return (uri if run_cmd(cmd) is not None else None), False
+
+    client = get_client('asset', asset_v1.AssetServiceClient)
+    request = {
+        'parent': f"projects/{project}",
+        'content_type': asset_v1.ContentType.RESOURCE,
+        'asset_types': asset_types or [],
+        'output_config': asset_v1.OutputConfig(gcs_destination=asset_v1.GcsDestination(uri=uri)),
+    }
+    try:
+        client.export_assets(request=request).result()
     except Exception as e:
-        print(f"Cloud Asset client error: {e}", file=sys.stderr)
-    return resources
+        print(f"Cloud Asset export failed for project {project}: {e}", file=sys.stderr)
+        return None, True
+    return uri, True
+
+
+def fetch_json_list(key, cmd):
+    """Run a gcloud list command and return ``(key, parsed list)``; [] on failure."""
+    out = run_cmd(cmd)
+    if not out:
+        return key, []
+    try:
+        return key, orjson.loads(out) or []
+    except Exception:
+        return key, []
+
+
+def message_to_dict(message):
+    # proto-plus messages wrap the raw protobuf in ``_pb``
+    return MessageToDict(getattr(message, '_pb', message))
+
+
+def list_compute_instances(project):
+    from google.cloud import compute_v1
+    client = get_client('compute_instances', compute_v1.InstancesClient)
+    instances = []
+    for _zone, scoped in client.aggregated_list(project=project):
+        instances.extend(message_to_dict(i) for i in scoped.instances)
+    return instances
+
+
+def list_gke_clusters(project):
+    from google.cloud import container_v1
+    client = get_client('gke_clusters', container_v1.ClusterManagerClient)
+    response = client.list_clusters(parent=f"projects/{project}/locations/-")
+    return [message_to_dict(c) for c in response.clusters]
+
+
+def list_cloud_functions(project):
+    from google.cloud import functions_v2
+    client = get_client('cloud_functions', functions_v2.FunctionServiceClient)
+    return [message_to_dict(f) for f in client.list_functions(parent=f"projects/{project}/locations/-")]
+
+
+def list_storage_buckets(project):
+    from google.cloud import storage
+    # project=None gives a client that is not bound to one project
+    client = get_client('storage', lambda: storage.Client(project=None))
+    # _properties holds the bucket resource exactly as returned by the JSON API
+    return [dict(b._properties) for b in client.list_buckets(project=project)]
+
+
+def fetch_with_client(key, project, lister, fallback_cmd):
+    """Call lister(project) and return ``(key, items)``.
+
+    Falls back to the gcloud command if the client library is not installed
+    or Application Default Credentials are not configured (e.g. after only
+    ``gcloud auth login``).
+    """
+    try:
+        return key, lister(project)
+    except ImportError:
+        return fetch_json_list(key, fallback_cmd)
+    except Exception as e:
+        if is_missing_credentials(e):
+            return fetch_json_list(key, fallback_cmd)
+        print(f"Failed to list {key} for project {project}: {e}", file=sys.stderr)
+        return key, []
+
+
+def fetch_gke_clusters(project):
+    # skip if the Kubernetes Engine API is not enabled to avoid noisy 403 errors
+    if not is_service_enabled(project, 'container.googleapis.com'):
+        print(f"Kubernetes Engine API not enabled for project {project}; skipping GKE cluster listing.")
+        return 'gke_clusters', []
+    return fetch_with_client('gke_clusters', project, list_gke_clusters,
+                             f"gcloud container clusters list --project={project} --format=json")
 
 
 def gather_resources(project):
-    resources = {}
+    # The listing calls are independent and dominated by API latency, so run
+    # them concurrently rather than one after another.
+    client_tasks = [
+        ('compute_instances', list_compute_instances, f"gcloud compute instances list --project={project} --format=json"),
+        ('cloud_functions', list_cloud_functions, f"gcloud functions list --project={project} --format=json"),
+        ('storage_buckets', list_storage_buckets, f"gcloud storage buckets list --project={project} --format=json"),
+    ]
+    order = ['compute_instances', 'gke_clusters', 'cloud_functions', 'sql_instances', 'storage_buckets']
+
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=len(order)) as executor:
+        futures = [executor.submit(fetch_with_client, key, project, lister, cmd)
+                   for key, lister, cmd in client_tasks]
+        futures.append(executor.submit(fetch_gke_clusters, project))
+        # Cloud SQL has no google-cloud-python admin client; keep using gcloud
+        futures.append(executor.submit(fetch_json_list, 'sql_instances',
+                                       f"gcloud sql instances list --project={project} --format=json"))
+        for future in as_completed(futures):
+            key, items = future.result()
+            fetched[key] = items
+
+    # keep a stable key (and therefore sheet) order regardless of completion order
+    return {key: fetched.get(key, []) for key in order}
+
+
+def _dumps_nested(value):
+    if isinstance(value, (dict, list)):
+        return orjson.dumps(value).decode()
+    return value
+
+
+def object_columns(df):
+    """Return the columns of df with numpy object dtype (not pandas string columns)."""
+    return [col for col, dtype in df.dtypes.items() if dtype == object]
+
+
+def stringify_nested(df):
+    """JSON-encode dicts and lists in object columns so every cell is a scalar.
+
+    Every cell of every object column is checked, since a column can hold a
+    string for one resource and a list for another.
+    """
+    for col in object_columns(df):
+        df[col] = df[col].map(_dumps_nested)
+    return df
 
-    # Compute instances
-    out = run_cmd(f"gcloud compute instances list --project={project} --format=json")
-    if out:
-        try:
-            resources['compute_instances'] = json.loads(out)
-        except Exception:
-            resources['compute_instances'] = []
+
+def table_to_frame(table):
+    """Convert an Arrow table to a DataFrame shaped like json_normalize output.
+
+    Struct columns are flattened into dotted column names and list columns
+    are stored as JSON strings.
+    """
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+    for i, field in enumerate(table.schema):
+        if pa.types.is_list(field.type) or pa.types.is_large_list(field.type):
+            encoded = [None if v is None else orjson.dumps(v).decode() for v in table.column(i).to_pylist()]
+            table = table.set_column(i, field.name, pa.array(encoded, type=pa.string()))
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def items_to_frame(items):
+    """Build a DataFrame from a list of resource dicts, flattening nested objects.
+
+    Values that are still lists (or empty dicts) after flattening are stored
+    as JSON strings. Arrow tables are converted with table_to_frame.
+    """
+    if isinstance(items, pa.Table):
+        return table_to_frame(items)
+    if isinstance(items, list) and len(items) > 0 and isinstance(items[0], dict):
+        df = pd.json_normalize(items)
     else:
-        resources['compute_instances'] = []
+        df = pd.DataFrame(items)
+    return stringify_nested(df).convert_dtypes(dtype_backend='pyarrow')
 
-    # GKE clusters - skip if the Kubernetes Engine API is not enabled to avoid noisy 403 errors
-    if is_service_enabled(project, 'container.googleapis.com'):
-        out = run_cmd(f"gcloud container clusters list --project={project} --format=json")
-        if out:
-            try:
-                resources['gke_clusters'] = json.loads(out)
-            except Exception:
-                resources['gke_clusters'] = []
+
+def non_empty_resources(resources):
+    """Return the entries of resources that hold at least one item."""
+    kept = {}
+    for key, items in resources.items():
+        if items is not None and len(items) > 0:
+            kept[key] = items
         else:
-            resources['gke_clusters'] = []
-    else:
-        resources['gke_clusters'] = []
-        print(f"Kubernetes Engine API not enabled for project {project}; skipping GKE cluster listing.")
+            print(f"No resources for {key}; skipping.")
+    return kept
 
-    # Cloud Functions
-    out = run_cmd(f"gcloud functions list --project={project} --format=json")
-    if out:
-        try:
-            resources['cloud_functions'] = json.loads(out)
-        except Exception:
-            resources['cloud_functions'] = []
-    else:
-        resources['cloud_functions'] = []
 
-    # Cloud SQL instances
-    out = run_cmd(f"gcloud sql instances list --project={project} --format=json")
-    if out:
-        try:
-            resources['sql_instances'] = json.loads(out)
-        except Exception:
-            resources['sql_instances'] = []
-    else:
-        resources['sql_instances'] = []
+# Column recording the ``project::resource_type`` key each row was collected
+# under; the leading underscore keeps it clear of GCP resource field names.
+SOURCE_COLUMN = '_source'
 
-    # Storage buckets - use gcloud storage
-    out = run_cmd(f"gcloud storage buckets list --project={project} --format=json")
-    if out:
+
+def resources_to_frame(resources):
+    """Combine all resource lists into one DataFrame.
+
+    Each row keeps the key it was collected under (``project::resource_type``)
+    in a leading SOURCE_COLUMN so the combined table can be split again.
+    """
+    frames = []
+    for key, items in resources.items():
         try:
-            # gcloud storage returns list of bucket objects
-            resources['storage_buckets'] = json.loads(out)
-        except Exception:
-            resources['storage_buckets'] = []
-    else:
-        resources['storage_buckets'] = []
+            df = items_to_frame(items)
+            df.insert(0, SOURCE_COLUMN, key)
+        except Exception as e:
+            print(f"Failed to build table for {key}: {e}", file=sys.stderr)
+            continue
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=[SOURCE_COLUMN])
+    df = pd.concat(frames, ignore_index=True)
+    # The same column can hold e.g. numbers for one resource type and strings
+    # for another; store such columns as strings so they fit one Arrow type,
+    # with lists and dicts as JSON like everywhere else.
+    for col in object_columns(df):
+        values = df[col].dropna()
+        if values.map(type).nunique() > 1:
+            df[col] = values.map(lambda v: _dumps_nested(v) if isinstance(v, (dict, list)) else str(v)).reindex(df.index)
+    return df
+
+
+def resources_to_table(resources):
+    """Combine all resource lists into one Arrow table.
+
+    Nested values stay as struct/list columns instead of being flattened or
+    JSON-encoded; schemas of the different resource lists are merged. Like
+    resources_to_frame, a leading SOURCE_COLUMN records each row's key.
+    Raises pyarrow.ArrowException, TypeError or OverflowError if the values
+    cannot be combined.
+    """
+    tables = []
+    for key, items in resources.items():
+        # pa.array infers one struct type from the keys of every record;
+        # Table.from_pylist would only use the keys of the first one.
+        table = items if isinstance(items, pa.Table) else pa.Table.from_struct_array(pa.array(items))
+        tables.append(table.add_column(0, SOURCE_COLUMN, pa.array([key] * len(table), type=pa.string())))
+    return pa.concat_tables(tables, promote_options='permissive')
+
+
+def _without_empty_structs(type_):
+    """Return type_ minus any struct fields with no children, or None if nothing is left."""
+    if pa.types.is_struct(type_):
+        fields = []
+        for field in type_:
+            child = _without_empty_structs(field.type)
+            if child is not None:
+                fields.append(field.with_type(child))
+        return pa.struct(fields) if fields else None
+    if pa.types.is_list(type_):
+        child = _without_empty_structs(type_.value_type)
+        return pa.list_(type_.value_field.with_type(child)) if child is not None else None
+    return type_
+
+
+def drop_empty_structs(table):
+    """Remove struct columns/fields that have no children (e.g. from ``{}`` values).
+
+    Parquet cannot store a struct without child fields, and such columns
+    carry no data.
+    """
+    fields = []
+    for field in table.schema:
+        type_ = _without_empty_structs(field.type)
+        if type_ is not None:
+            fields.append(field.with_type(type_))
+    return table.select([f.name for f in fields]).cast(pa.schema(fields))
 
-    return resources
 
+def write_table_or_frame(resources, output_file, write_table, write_frame):
+    """Write resources as one Arrow table, keeping nested values structured.
 
-def resources_to_excel(resources, output_file):
-    def sanitize(name, used):
-        # Excel sheet name rules: <=31 chars and cannot contain : \/ ? * [ ]
-        invalid = ':\\/?*[]'
-        s = ''.join('_' if c in invalid else c for c in name)
-        s = s[:31]
+    write_table(table, output_file) is tried first; if the resource lists
+    cannot be combined into one Arrow table, write_frame(df, output_file)
+    writes the flattened DataFrame instead. Returns False (and writes
+    nothing) if there are no resources.
+    """
+    resources = non_empty_resources(resources)
+    if not resources:
+        return False
+    try:
+        write_table(resources_to_table(resources), output_file)
+    except (pa.ArrowException, TypeError, OverflowError) as e:
+        # TypeError: items that are not dicts; OverflowError: integers >= 2**63
+        print(f"Cannot keep nested columns ({e}); writing them as flattened/JSON columns.", file=sys.stderr)
+        write_frame(resources_to_frame(resources), output_file)
+    return True
+
+
+def resources_to_parquet(resources, output_file):
+    return write_table_or_frame(
+        resources, output_file,
+        lambda table, out: pq.write_table(drop_empty_structs(table), out, compression='zstd'),
+        lambda df, out: df.to_parquet(out, engine='pyarrow', compression='zstd', index=False))
+
+
+def resources_to_feather(resources, output_file):
+    return write_table_or_frame(
+        resources, output_file,
+        lambda table, out: pa_feather.write_feather(table, out, compression='lz4'),
+        lambda df, out: df.to_feather(out, compression='lz4'))
+
+
+# Excel sheet name rules: <=31 chars and cannot contain : \/ ? * [ ]
+MAX_SHEET_NAME_LEN = 31
+_SHEET_NAME_TRANS = str.maketrans({c: '_' for c in ':\\/?*[]'})
+
+
+def sanitize_sheet_name(name, used):
+    """Return a valid Excel sheet name for name that is not already in used.
+
+    used holds the lower-cased names taken so far (Excel compares sheet
+    names case-insensitively) and is updated with the returned name.
+    """
+    s = name.translate(_SHEET_NAME_TRANS)[:MAX_SHEET_NAME_LEN]
+    if s == '' or s.lower() in used:
+        # Number from len(used) rather than 1 so that many names sharing a
+        # truncated prefix don't each re-probe every suffix already taken.
         base = s
-        i = 1
-        while s in used or s == '':
+        i = len(used)
+        while True:
             suffix = f"_{i}"
             # ensure total length <=31
-            s = (base[:31 - len(suffix)] + suffix) if len(base) + len(suffix) > 31 else base + suffix
+            s = base[:MAX_SHEET_NAME_LEN - len(suffix)] + suffix
+            if s.lower() not in used:
+                break
             i += 1
-        used.add(s)
-        return s
+    used.add(s.lower())
+    return s
+
+
+# Fixed column width (in characters) applied to every column up front
+EXCEL_COLUMN_WIDTH = 20
+
+
+def resources_to_excel(resources, output_file):
+    """Write one sheet per resource list.
+
+    Returns False (and leaves no file) if all lists are empty or no sheet
+    could be written completely.
+    """
+    resources = non_empty_resources(resources)
+    if not resources:
+        return False
 
     used_names = set()
-    with pd.ExcelWriter(output_file, engine='openpyxl') as writer:
+    # constant_memory streams each row to disk as it is written instead of
+    # building the whole sheet in memory; rows must therefore be written in order.
+    workbook = xlsxwriter.Workbook(output_file, {
+        'constant_memory': True,
+        'strings_to_numbers': False,
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+        # only applies to real date/time values; resource timestamps are text
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'remove_timezone': True,
+    })
+    written = 0
+    try:
         for key, items in resources.items():
             try:
-                if isinstance(items, list) and len(items) > 0 and isinstance(items[0], dict):
-                    df = pd.json_normalize(items)
-                else:
-                    df = pd.DataFrame(items)
-                sheet_name = sanitize(key, used_names)
-                df.to_excel(writer, sheet_name=sheet_name, index=False)
+                df = items_to_frame(items)
+                # xlsxwriter cannot write NaN; missing values become blank cells
+                df = df.astype(object).where(df.notna(), None)
             except Exception as e:
                 print(f"Failed to write sheet {key}: {e}", file=sys.stderr)
+                continue
+            sheet_name = sanitize_sheet_name(key, used_names)
+            worksheet = workbook.add_worksheet(sheet_name)
+            try:
+                worksheet.freeze_panes(1, 0)
+                if len(df.columns) > 0:
+                    worksheet.set_column(0, len(df.columns) - 1, EXCEL_COLUMN_WIDTH)
+                worksheet.write_row(0, 0, [str(c) for c in df.columns])
+                for row_num, row in enumerate(df.itertuples(index=False, name=None), start=1):
+                    worksheet.write_row(row_num, 0, row)
+            except Exception as e:
+                # xlsxwriter cannot remove a worksheet once added
+                print(f"Failed to write sheet {key}; sheet {sheet_name} is incomplete: {e}", file=sys.stderr)
+                continue
+            written += 1
+    finally:
+        workbook.close()
+    if not written:
+        os.remove(output_file)
+        return False
+    return True
+
+
+WRITERS = {
+    'parquet': resources_to_parquet,
+    'feather': resources_to_feather,
+    'xlsx': resources_to_excel,
+}
+
+
+# Default number of projects processed at the same time; keeps a large
+# multi-project run within per-user API quotas.
+DEFAULT_PROJECT_CONCURRENCY = 10
+
+# Files at least this large are uploaded in parallel chunks that GCS
+# assembles server side; smaller files go up in a single request.
+UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+UPLOAD_WORKERS = 8
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
 
 def upload_to_gcs(local_file, bucket, destination_path=None):
+    """Upload local_file to the bucket, skipping it if the same content is already there.
+
+    The SHA-256 of the file is stored in the object's ``content_hash``
+    metadata and compared against the existing object before uploading
+    (storage client path only; the gcloud fallback, used when the library
+    or Application Default Credentials are missing, always uploads).
+    """
     if not bucket:
         print("No bucket provided, skipping upload.")
         return False
-    dest = f"gs://{bucket}/"
-    if destination_path:
-        dest = f"gs://{bucket}/{destination_path}"
-    # Use gcloud storage cp
-    cmd = f"gcloud storage cp {local_file} {dest}"
-    out = run_cmd(cmd)
-    return out is not None
+    object_name = destination_path or os.path.basename(local_file)
+    if object_name.endswith('/'):
+        object_name += os.path.basename(local_file)
+
+    def gcloud_cp():
+        cmd = f"gcloud storage cp {local_file} gs://{bucket}/{object_name}"
+        out = run_cmd(cmd)
+        return out is not None
+
+    try:
+        from google.cloud import storage
+        from google.cloud.storage import transfer_manager
+    except Exception:
+        # fallback to gcloud storage cp
+        return gcloud_cp()
+
+    try:
+        client = get_client('storage', lambda: storage.Client(project=None))
+    except Exception as e:
+        if is_missing_credentials(e):
+            # no Application Default Credentials; gcloud uses its own login
+            return gcloud_cp()
+        print(f"Upload of {local_file} to gs://{bucket}/{object_name} failed: {e}", file=sys.stderr)
+        return False
+    gcs_bucket = client.bucket(bucket)
+    content_hash = file_sha256(local_file)
+    try:
+        existing = gcs_bucket.get_blob(object_name)
+    except Exception:
+        # The unchanged check is only an optimisation; e.g. an account that
+        # may create but not read objects should still upload.
+        existing = None
+    if existing is not None and (existing.metadata or {}).get('content_hash') == content_hash:
+        print(f"gs://{bucket}/{object_name} is unchanged, skipping upload.")
+        return True
+
+    try:
+        blob = gcs_bucket.blob(object_name)
+        blob.metadata = {'content_hash': content_hash}
+        if os.path.getsize(local_file) < UPLOAD_CHUNK_SIZE:
+            blob.upload_from_filename(local_file)
+        else:
+            transfer_manager.upload_chunks_concurrently(
+                local_file, blob, chunk_size=UPLOAD_CHUNK_SIZE, max_workers=UPLOAD_WORKERS)
+    except Exception as e:
+        print(f"Upload of {local_file} to gs://{bucket}/{object_name} failed: {e}", file=sys.stderr)
+        return False
+    return True
 
 
 def main():
     parser = argparse.ArgumentParser(description='Generate GCP infra inventory and upload to GCS')
     parser.add_argument('--project', '-p', required=False, help='GCP project id (or comma separated list)')
-    parser.add_argument('--bucket', '-b', required=False, help='GCS bucket name to upload the Excel file')
-    parser.add_argument('--output', '-o', required=False, help='Local output filename (default inventory_TIMESTAMP.xlsx)')
+    parser.add_argument('--bucket', '-b', required=False, help='GCS bucket name to upload the inventory file')
+    parser.add_argument('--output', '-o', required=False, help='Local output filename (default gcp-inventory-PROJECT-TIMESTAMP.FORMAT)')
+    parser.add_argument('--format', '-f', choices=sorted(WRITERS),
+                        help='Output format (default parquet); use xlsx for a spreadsheet with one sheet per resource type')
     parser.add_argument('--use-asset', action='store_true', help='Use Cloud Asset (gcloud asset) to collect resources across locations')
+    parser.add_argument('--export-direct', action='store_true',
+                        help='Export Cloud Asset resources straight to --bucket as JSON lines (one object per project), skipping the local file; '
+                             'always uses Cloud Asset, so --use-asset is implied')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_PROJECT_CONCURRENCY,
+                        help=f'Maximum number of projects processed at once (default {DEFAULT_PROJECT_CONCURRENCY})')
+    parser.add_argument('--asset-types', required=False,
+                        help='Comma separated Cloud Asset types to collect with --use-asset (default all), e.g. compute.googleapis.com/Instance')
     args = parser.parse_args()
+    if args.export_direct:
+        if not args.bucket:
+            parser.error('--export-direct requires --bucket')
+        if args.format or args.output:
+            parser.error('--export-direct writes JSON lines to the bucket and cannot be combined with --format or --output')
+    args.format = args.format or 'parquet'
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
 
     project = args.project or os.environ.get('GOOGLE_CLOUD_PROJECT')
     if not project:
@@ -218,26 +745,48 @@ def main():
         sys.exit(2)
 
     projects = [p.strip() for p in project.split(',') if p.strip()]
+    if not projects:
+        print('No project ids given', file=sys.stderr)
+        sys.exit(2)
+    asset_types = [t.strip() for t in (args.asset_types or '').split(',') if t.strip()]
+    ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    workers = min(len(projects), args.concurrency)
+
+    if args.export_direct:
+        def export(p):
+            print(f"Exporting resources for project {p} to bucket {args.bucket}")
+            return p, export_asset_resources(p, args.bucket, f"gcp-inventory-assets-{p}-{ts}.json", asset_types)
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for p, (uri, finished) in executor.map(export, projects):
+                if uri and finished:
+                    print(f"Exported {p} to {uri}")
+                elif uri:
+                    print(f"Export started for {p} to {uri}; check progress with 'gcloud asset operations describe'")
+                else:
+                    print(f"Export failed for project {p}", file=sys.stderr)
+        return
 
-    combined = {}
-    for p in projects:
+    def collect(p):
         print(f"Gathering resources for project: {p}")
         if args.use_asset:
-            assets = gather_asset_resources(p)
-            combined_key = f"{p}::asset_resources"
-            combined[combined_key] = assets
-        else:
-            res = gather_resources(p)
-            # prefix keys with project name
-            for k, v in res.items():
-                combined_key = f"{p}::{k}"
-                combined[combined_key] = v
+            return {f"{p}::asset_resources": gather_asset_resources(p, asset_types)}
+        # prefix keys with project name
+        return {f"{p}::{k}": v for k, v in gather_resources(p).items()}
 
-    ts = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
-    output = args.output or f"gcp-inventory-{projects[0]}-{ts}.xlsx"
+    # Projects are independent, so collect up to `workers` of them at a time;
+    # map() keeps the results in the order the projects were given.
+    combined = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for res in executor.map(collect, projects):
+            combined.update(res)
+
+    output = args.output or f"gcp-inventory-{projects[0]}-{ts}.{args.format}"
 
     print(f"Writing inventory to {output}")
-    resources_to_excel(combined, output)
+    if not WRITERS[args.format](combined, output):
+        print("No inventory file written.")
+        return
 
     if args.bucket:
         print(f"Uploading {output} to bucket {args.bucket}")